@@ -0,0 +1,196 @@
+import gzip
+import time
+import zlib
+
+import brotli
+import zstandard
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.metrics import counter
+
+# Порядок предпочтения сервера при одинаковом q в Accept-Encoding
+ENCODINGS = ("zstd", "br", "gzip")
+
+# Кэш пишется один раз, поэтому можно сжимать сильнее, чем на лету
+PRECOMPRESS_LEVELS = {"zstd": 12, "br": 9, "gzip": 9}
+STREAM_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml")
+MINIMUM_SIZE = 500
+
+compression_seconds = counter(
+    "compression_seconds_total", "CPU time spent compressing responses"
+)
+compression_input_bytes = counter(
+    "compression_input_bytes_total", "Bytes before compression"
+)
+compression_output_bytes = counter(
+    "compression_output_bytes_total", "Bytes after compression"
+)
+responses_by_encoding = counter(
+    "responses_by_encoding_total", "Compressible responses served per Content-Encoding"
+)
+
+
+def negotiate_encoding(accept_encoding: str, available=ENCODINGS) -> str:
+    """Выбирает кодировку по Accept-Encoding (учитывает q); identity, если подходящей нет"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    best, best_q = "identity", 0.0
+    for encoding in available:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data: bytes, encoding: str, level: int = None) -> bytes:
+    """Сжимает данные целиком и учитывает затраты в метриках"""
+    if level is None:
+        level = PRECOMPRESS_LEVELS[encoding]
+
+    started = time.process_time()
+    if encoding == "zstd":
+        result = zstandard.ZstdCompressor(level=level).compress(data)
+    elif encoding == "br":
+        result = brotli.compress(data, quality=level)
+    elif encoding == "gzip":
+        result = gzip.compress(data, compresslevel=level)
+    else:
+        raise ValueError(f"Unsupported encoding: {encoding}")
+
+    _record(encoding, time.process_time() - started, len(data), len(result))
+    return result
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    if encoding == "br":
+        return brotli.decompress(data)
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def _record(encoding: str, seconds: float, size_in: int, size_out: int) -> None:
+    compression_seconds.inc(seconds, encoding=encoding)
+    compression_input_bytes.inc(size_in, encoding=encoding)
+    compression_output_bytes.inc(size_out, encoding=encoding)
+
+
+class StreamCompressor:
+    """Потоковое сжатие: каждый чанк сбрасывается сразу, чтобы клиент не ждал конца ответа"""
+
+    def __init__(self, encoding: str, level: int = None):
+        self.encoding = encoding
+        if level is None:
+            level = STREAM_LEVELS[encoding]
+
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        elif encoding == "gzip":
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        started = time.process_time()
+        if self.encoding == "zstd":
+            result = self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        elif self.encoding == "br":
+            result = self._compressor.process(chunk) + self._compressor.flush()
+        else:
+            result = self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        _record(self.encoding, time.process_time() - started, len(chunk), len(result))
+        return result
+
+    def finish(self) -> bytes:
+        started = time.process_time()
+        if self.encoding == "zstd":
+            result = self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        elif self.encoding == "br":
+            result = self._compressor.finish()
+        else:
+            result = self._compressor.flush()
+        _record(self.encoding, time.process_time() - started, 0, len(result))
+        return result
+
+
+class CompressionMiddleware:
+    """Сжимает на лету ответы, у которых ещё нет Content-Encoding (JSON, стриминг)"""
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                compressible = (
+                    "content-encoding" not in headers
+                    and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                    and (more_body or len(body) >= self.minimum_size)
+                )
+                if compressible:
+                    compressor = StreamCompressor(encoding)
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    if "content-length" in headers:
+                        del headers["content-length"]
+                    responses_by_encoding.inc(encoding=encoding)
+                await send(start_message)
+                start_message = None
+
+            if compressor is None:
+                await send(message)
+                return
+
+            chunk = compressor.compress(body) if body else b""
+            if not more_body:
+                chunk += compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
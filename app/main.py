@@ -1,28 +1,73 @@
 from io import BytesIO
 
-import camelot
-import pdfplumber
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status, UploadFile, File
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import Annotated
+from typing import Annotated, Optional
 from datetime import timedelta, datetime
+import pypdfium2
 import uvicorn
 from sqlalchemy.orm import Session
 
 import logging
 
-from fastapi.responses import StreamingResponse, HTMLResponse
+from fastapi.responses import StreamingResponse, HTMLResponse, PlainTextResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-
+from starlette.concurrency import run_in_threadpool
+
+from app.compression import CompressionMiddleware, negotiate_encoding, responses_by_encoding
+from app.metrics import render_metrics
+from app.scheduling import (
+    BATCH,
+    INTERACTIVE,
+    conversion_pages_limiter,
+    conversion_scheduler,
+    lane_selector,
+    upload_limiter,
+    user_weight
+)
 from app.models.html import HTMLFile
 from app.models.pdf import PDFFile
 from app.models.user import User
-from app.database import Base, engine, get_db
-from app.schemas.html_resp import HTMLFileCreate, HTMLFileResponse
+from app.database import Base, SessionLocal, engine, get_db
+from app.schemas.html_resp import HTMLFileCreate, HTMLFileResponse, HTMLPagePatch, HTMLRevisionResponse
 from app.schemas.pdf_resp import PDFResponse
 from app.schemas.user import UserCreate, UserOut
 from app.schemas.token import Token
-# from app.pdf_handlers.pdf_reader_camelot_plumber import process_pdf_to_html
+from app.storage.html_store import (
+    add_revision,
+    create_html_file,
+    decompress_html,
+    get_latest_content,
+    get_page,
+    get_revision_content,
+    list_revisions,
+    patch_page
+)
+from app.pdf_handlers.converter import count_pages
+from app.pdf_handlers.extractors import DEFAULT_ENGINE, EXTRACTORS
+from app.pdf_handlers.workers import ConversionFailed, conversion_supervisor
+from app.pdf_handlers.thumbnails import (
+    FORMATS as THUMB_FORMATS,
+    THUMB_DEFAULT_WIDTH,
+    THUMB_MAX_WIDTH,
+    THUMB_MIN_WIDTH,
+    THUMB_PREGENERATE_PAGES,
+    content_hash,
+    ensure_source,
+    get_thumbnail,
+    negotiate_format,
+    page_count,
+    pregenerate,
+    source_path
+)
+from app.storage.conversion_cache import get_cached_result, get_variant, store_result
+from app.storage.table_export import (
+    FORMATS as EXPORT_FORMATS,
+    iter_cells,
+    missing_results,
+    stream_csv,
+    stream_parquet,
+)
 from app.authorization.auth_user import (
     authenticate_user,
     create_access_token,
@@ -45,8 +90,11 @@ app.add_middleware(
     allow_origins=["http://localhost:5173"],
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    # Фронтенд читает список PDF без результата конвертации из ответа /tables/export
+    expose_headers=["X-Missing-Pdf-Ids"]
 )
+app.add_middleware(CompressionMiddleware)
 
 
 
@@ -121,11 +169,18 @@ async def get_users(
 
 
 @app.post("/upload-pdf/", response_model=PDFResponse)
-async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_pdf(
+        current_user: Annotated[User, Depends(get_current_active_user)],
+        background_tasks: BackgroundTasks,
+        file: UploadFile = File(...),
+        db: Session = Depends(get_db)
+):
     # Проверка типа файла
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
+    upload_limiter.check(current_user.user_id)
+
     try:
         # Чтение файла
         contents = await file.read()
@@ -136,7 +191,8 @@ async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)
             filename=file.filename,
             content=contents,
             upload_date=datetime.now().isoformat(),
-            file_size=file_size
+            file_size=file_size,
+            content_hash=content_hash(contents)
         )
 
         # Сохранение в базу
@@ -144,6 +200,10 @@ async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)
         db.commit()
         db.refresh(db_pdf)
 
+        if THUMB_PREGENERATE_PAGES > 0:
+            ensure_source(db_pdf.content_hash, contents)
+            background_tasks.add_task(pregenerate, db_pdf.content_hash)
+
         # Формирование ответа
         response_data = {
             "id": db_pdf.id,
@@ -171,89 +231,126 @@ async def get_pdf_info(pdf_id: int, db: Session = Depends(get_db)):
     )
 
 
+@app.get("/pdf/{pdf_id}/pages/{page_number}/thumb")
+async def get_page_thumbnail(
+        pdf_id: int,
+        page_number: int,
+        request: Request,
+        width: int = Query(THUMB_DEFAULT_WIDTH, ge=THUMB_MIN_WIDTH, le=THUMB_MAX_WIDTH),
+        format: Optional[str] = Query(None, pattern="^(webp|png)$"),
+        db: Session = Depends(get_db)
+):
+    # Сам PDF из базы читаем только если его ещё нет в кэше превью
+    pdf_row = db.query(PDFFile.id, PDFFile.content_hash).filter(PDFFile.id == pdf_id).first()
+    if not pdf_row:
+        raise HTTPException(status_code=404, detail="PDF не найден")
+
+    pdf_hash = pdf_row.content_hash
+    if pdf_hash is None or not source_path(pdf_hash).exists():
+        pdf_file = db.query(PDFFile).get(pdf_id)
+        if not pdf_file.content:
+            raise HTTPException(status_code=404, detail="PDF content is empty")
+        if pdf_hash is None:
+            pdf_hash = pdf_file.content_hash = content_hash(pdf_file.content)
+            db.commit()
+        ensure_source(pdf_hash, pdf_file.content)
+
+    # Номер страницы проверяем до ETag, иначе угаданный ETag дал бы 304 для несуществующей страницы
+    if not 1 <= page_number <= page_count(pdf_hash):
+        raise HTTPException(status_code=404, detail="Page not found")
+
+    fmt = format or negotiate_format(request.headers.get("accept", ""))
+    etag = f'"{pdf_hash[:16]}-{page_number}-{width}-{fmt}"'
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": etag,
+        "Vary": "Accept",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        path = await get_thumbnail(pdf_hash, page_number, width, fmt)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Page not found")
+
+    return FileResponse(path, media_type=THUMB_FORMATS[fmt], headers=headers)
+
+
+def table_engine(engine: str = DEFAULT_ENGINE) -> str:
+    if engine not in EXTRACTORS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown table engine '{engine}', available: {', '.join(EXTRACTORS)}"
+        )
+    return engine
+
+
+def _convert_and_store(db: Session, pdf_id: int, content: bytes, engine: str):
+    """Конвертация и сжатие результата во все кодировки — выполняется в пуле потоков, не в event loop"""
+    html_content, tables = conversion_supervisor.convert(content, engine)
+    return store_result(db, pdf_id, engine, html_content, tables)
+
+
 @app.get("/pdf/redactor/{pdf_str}", response_class=HTMLResponse)
-async def get_pdf_for_redactor(pdf_str: str, db: Session = Depends(get_db)):
-# === nemnogo hard coding`a ===
+async def get_pdf_for_redactor(
+        pdf_str: str,
+        request: Request,
+        current_user: Annotated[User, Depends(get_current_active_user)],
+        engine: str = Depends(table_engine),
+        priority: str = Query(INTERACTIVE, pattern=f"^({INTERACTIVE}|{BATCH})$"),
+        db: Session = Depends(get_db)
+):
     try:
-        pdf_record = db.query(PDFFile).filter(PDFFile.filename == pdf_str).first()
-        if not pdf_record:
+        pdf_row = db.query(PDFFile.id).filter(PDFFile.filename == pdf_str).first()
+        if not pdf_row:
             raise HTTPException(status_code=404, detail="PDF not found")
-        if not pdf_record.content:
-            raise HTTPException(status_code=404, detail="PDF content is empty")
 
-        html_content = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>PDF Conversion</title>
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.5; }
-                table { border-collapse: collapse; margin: 20px 0; }
-                th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
-                th { background-color: #f2f2f2; }
-                .page { page-break-after: always; margin-bottom: 50px; }
-                .page-number { font-weight: bold; margin-top: 20px; }
-                .text-content { margin: 10px 0; }
-            </style>
-        </head>
-        <body>
-        """
-
-        pdf_file = BytesIO(pdf_record.content)
-
-        with pdfplumber.open(pdf_file) as pdf:
-            for page_num, page in enumerate(pdf.pages, start=1):
-                html_content += f'<div class="page" id="page-{page_num}">'
-                html_content += f'<div class="page-number">Page {page_num}</div>'
-
-                page_width = page.width
-                page_height = page.height
-
-                tables = camelot.read_pdf(pdf_file, pages=str(page_num), flavor='lattice')
-
-                table_bboxes = []
-                for table in tables:
-                    x1, y1, x2, y2 = table._bbox
-                    bbox = (x1, page_height - y2, x2, page_height - y1)
-                    table_bboxes.append(bbox)
-
-                    html_content += '<table>'
-                    for row in table.data:
-                        html_content += '<tr>'
-                        for cell in row:
-                            html_content += f'<td>{cell}</td>'
-                        html_content += '</tr>'
-                    html_content += '</table>'
-
-                words = page.extract_words()
-                if words:
-                    filtered_words = []
-                    for word in words:
-                        word_bbox = (word['x0'], word['top'], word['x1'], word['bottom'])
-                        in_table = False
-                        for table_bbox in table_bboxes:
-                            if bbox_overlap(word_bbox, table_bbox):
-                                in_table = True
-                                break
-                        if not in_table:
-                            filtered_words.append(word)
-
-                    if filtered_words:
-                        formatted_text = format_text(filtered_words)
-                        html_content += f'<div class="text-content">{formatted_text}</div>'
-
-                html_content += '</div>'
-
-        html_content += """
-        </body>
-        </html>
-        """
-
-        return HTMLResponse(content=html_content)
+        result = get_cached_result(db, pdf_row.id, engine)
+        if result is None:
+            # Сам PDF из базы читаем только при промахе кэша
+            content = db.query(PDFFile.content).filter(PDFFile.id == pdf_row.id).scalar()
+            if not content:
+                raise HTTPException(status_code=404, detail="PDF content is empty")
+
+            # Лимиты и очередь только для реальной конвертации, ответ из кэша отдаём сразу
+            try:
+                page_count = count_pages(content)
+            except pypdfium2.PdfiumError as e:
+                raise ConversionFailed("error", f"Cannot read PDF: {e}", 0.0)
+            conversion_pages_limiter.check(current_user.user_id, page_count)
+            lane = lane_selector.choose(current_user.user_id, priority, page_count)
+            converted = False
+            try:
+                async with conversion_scheduler.slot(
+                        current_user.user_id, lane, cost=page_count, weight=user_weight(current_user.user_id)
+                ):
+                    result = get_cached_result(db, pdf_row.id, engine)
+                    if result is None:
+                        converted = True
+                        result = await run_in_threadpool(_convert_and_store, db, pdf_row.id, content, engine)
+            finally:
+                # Очередь переполнена, результат успел сделать другой запрос или клиент ушёл —
+                # страницы не конвертировались, возвращаем их пользователю
+                if not converted:
+                    conversion_pages_limiter.refund(current_user.user_id, page_count)
+
+        # Отдаём заранее сжатый вариант без повторного сжатия на каждый запрос
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+        responses_by_encoding.inc(encoding=encoding)
+        headers = {"Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return HTMLResponse(content=get_variant(result, encoding), headers=headers)
 
     except HTTPException:
         raise
+    except ConversionFailed as e:
+        # Битый, зависший или слишком тяжёлый документ — ошибка документа, а не сервера
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY if e.is_document_error else 500,
+            detail={"pdf": pdf_str, **e.to_dict()}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -261,93 +358,120 @@ async def get_pdf_for_redactor(pdf_str: str, db: Session = Depends(get_db)):
         )
 
 
-def bbox_overlap(bbox1, bbox2):
-    """Проверяет пересекаются ли два bounding box"""
-    x1_1, y1_1, x2_1, y2_1 = bbox1
-    x1_2, y1_2, x2_2, y2_2 = bbox2
-
-    # Проверка на пересечение по x и y
-    overlap_x = x1_1 < x2_2 and x2_1 > x1_2
-    overlap_y = y1_1 < y2_2 and y2_1 > y1_2
-
-    return overlap_x and overlap_y
-
-
-def format_text(words):
-    """Форматирует список слов в читаемый текст"""
-    words = sorted(words, key=lambda w: (w['top'], w['x0']))
+# Обработчики с zstd (дельты, пересжатие фрагментов) объявлены через def — FastAPI выполняет их
+# в пуле потоков, и сжатие большого документа не блокирует event loop
+@app.post("/file/save", response_model=HTMLFileResponse)
+def save_new_file(
+        file_data: HTMLFileCreate,
+        db: Session = Depends(get_db),
+):
+    try:
+        # Повторное сохранение под тем же именем добавляет ревизию, а не новый файл
+        existing_file = (
+            db.query(HTMLFile)
+            .filter(HTMLFile.filename == file_data.filename)
+            .with_for_update()
+            .first()
+        )
+        if existing_file:
+            db_file = add_revision(db, existing_file, file_data.content)
+        else:
+            db_file = create_html_file(db, file_data.filename, file_data.content, file_data.source_pdf_id)
 
-    lines = []
-    current_line = []
-    current_top = None
+        db.commit()
+        db.refresh(db_file)
 
-    for word in words:
-        if current_top is None or abs(word['top'] - current_top) < 5:
-            current_line.append(word)
-            current_top = word['top']
-        else:
-            lines.append(format_line(current_line))
-            current_line = [word]
-            current_top = word['top']
+        return db_file
 
-    if current_line:
-        lines.append(format_line(current_line))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error saving file: {str(e)}"
+        )
 
-    return "<br>".join(lines)
 
+@app.get("/file/{file_id}", response_class=HTMLResponse)
+def get_file(file_id: int, db: Session = Depends(get_db)):
+    db_file = db.query(HTMLFile).get(file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
+    return HTMLResponse(content=get_latest_content(db_file))
 
-def format_line(words):
-    """Форматирует строку текста"""
-    line_text = ""
-    prev_x1 = None
 
-    for word in sorted(words, key=lambda w: w['x0']):
-        if prev_x1 and word['x0'] - prev_x1 > 10:
-            line_text += "    "
-        elif prev_x1:
-            line_text += " "
-        line_text += word['text']
-        prev_x1 = word['x1']
+@app.get("/file/{file_id}/pages/{page_number}", response_class=HTMLResponse)
+async def get_file_page(file_id: int, page_number: int, db: Session = Depends(get_db)):
+    db_file = db.query(HTMLFile).get(file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
 
-    return line_text
+    page = get_page(db, file_id, page_number) if 1 <= page_number <= db_file.page_count else None
+    if page is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+    return HTMLResponse(content=decompress_html(page.content))
 
 
-@app.post("/file/save", response_model=HTMLFileResponse)
-async def save_new_file(
-        file_data: HTMLFileCreate,
+@app.patch("/file/{file_id}/pages/{page_number}", response_model=HTMLFileResponse)
+def patch_file_page(
+        file_id: int,
+        page_number: int,
+        page_data: HTMLPagePatch,
         db: Session = Depends(get_db),
 ):
-    try:
-        # Проверяем, что файл с таким именем не существует
-        existing_file = db.query(HTMLFile).filter(HTMLFile.filename == file_data.filename).first()
-        if existing_file:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="File with this name already exists"
-            )
-
-        # Создаем новую запись
-        db_file = HTMLFile(
-            filename=file_data.filename,
-            content=file_data.content,
-            source_pdf_id=file_data.source_pdf_id,
-            upload_date=datetime.now(),
-            file_size=len(file_data.content.encode('utf-8')))
+    # Блокируем файл, чтобы параллельные правки не получили одинаковый номер ревизии
+    db_file = db.query(HTMLFile).filter(HTMLFile.id == file_id).with_for_update().first()
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
 
-        db.add(db_file)
+    try:
+        patch_page(db, db_file, page_number, page_data.content)
         db.commit()
         db.refresh(db_file)
-
         return db_file
-
+    except LookupError as e:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error saving file: {str(e)}"
+            detail=f"Error saving page: {str(e)}"
         )
 
 
+@app.get("/file/{file_id}/revisions", response_model=list[HTMLRevisionResponse])
+async def get_file_revisions(file_id: int, db: Session = Depends(get_db)):
+    db_file = db.query(HTMLFile).get(file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
+    return [
+        HTMLRevisionResponse(
+            revision=rev.revision,
+            is_snapshot=rev.is_snapshot,
+            page_number=rev.page_number,
+            file_size=rev.file_size,
+            stored_size=len(rev.payload),
+            created_at=rev.created_at,
+        )
+        for rev in list_revisions(db, file_id)
+    ]
+
+
+@app.get("/file/{file_id}/revisions/{revision}", response_class=HTMLResponse)
+def get_file_revision(file_id: int, revision: int, db: Session = Depends(get_db)):
+    db_file = db.query(HTMLFile).get(file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    content = get_revision_content(db, db_file, revision)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return HTMLResponse(content=content)
+
+
 @app.get("/pdf/all", response_model=list[PDFResponse])
 async def get_all_pdf(db: Session = Depends(get_db)):
     pdfs = db.query(PDFFile).all()
@@ -374,6 +498,41 @@ async def delete_pdf(pdf_id: int, db: Session = Depends(get_db)):
 async def get_all_html_files(db: Session = Depends(get_db)):
     return db.query(HTMLFile).all()
 
+@app.get("/tables/export")
+async def export_tables(
+        pdf_ids: str = Query(..., description="Comma-separated PDF ids"),
+        format: str = Query("csv", pattern="^(csv|parquet)$"),
+        engine: str = Depends(table_engine),
+        db: Session = Depends(get_db)
+):
+    try:
+        ids = sorted({int(pdf_id) for pdf_id in pdf_ids.split(",") if pdf_id.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="pdf_ids must be comma-separated integers")
+    if not ids:
+        raise HTTPException(status_code=400, detail="No pdf_ids given")
+
+    # Экспорт только из кэша: документы без результата конвертации перечисляем в заголовке
+    missing = missing_results(db, ids, engine)
+    headers = {"Content-Disposition": f'attachment; filename="tables.{format}"'}
+    if missing:
+        headers["X-Missing-Pdf-Ids"] = ",".join(map(str, missing))
+
+    def generate():
+        # Своя сессия: сессия из зависимости закрывается раньше, чем закончится стриминг
+        export_db = SessionLocal()
+        try:
+            cells = iter_cells(export_db, ids, engine)
+            yield from (stream_parquet(cells) if format == "parquet" else stream_csv(cells))
+        finally:
+            export_db.close()
+
+    return StreamingResponse(generate(), media_type=EXPORT_FORMATS[format], headers=headers)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
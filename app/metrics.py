@@ -0,0 +1,99 @@
+import threading
+from collections import deque
+
+
+class Counter:
+    """Счётчик с метками, накапливает сумму"""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Summary:
+    """Квантили по скользящему окну последних наблюдений"""
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, name: str, description: str, window: int = 1024):
+        self.name = name
+        self.description = description
+        self.window = window
+        self._observations = {}
+        self._counts = {}
+        self._sums = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            if key not in self._observations:
+                self._observations[key] = deque(maxlen=self.window)
+            self._observations[key].append(value)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def quantile(self, q: float, **labels) -> float:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = sorted(self._observations.get(key, ()))
+        if not values:
+            return 0.0
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} summary"]
+        with self._lock:
+            snapshot = {key: sorted(values) for key, values in self._observations.items()}
+            counts = dict(self._counts)
+            sums = dict(self._sums)
+        for key, values in sorted(snapshot.items()):
+            for q in self.QUANTILES:
+                value = values[min(int(q * len(values)), len(values) - 1)]
+                lines.append(f"{self.name}{_format_labels(key + (('quantile', str(q)),))} {value}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {sums[key]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {counts[key]}")
+        return lines
+
+
+def _format_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+_registry = []
+
+
+def counter(name: str, description: str) -> Counter:
+    metric = Counter(name, description)
+    _registry.append(metric)
+    return metric
+
+
+def summary(name: str, description: str, window: int = 1024) -> Summary:
+    metric = Summary(name, description, window)
+    _registry.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    """Отдаёт все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, LargeBinary, String, DateTime, ForeignKey, UniqueConstraint
+
+from app.database import Base
+
+
+class ConversionResult(Base):
+    __tablename__ = "conversion_results"
+    __table_args__ = (UniqueConstraint("pdf_id", "engine"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    pdf_id = Column(Integer, ForeignKey("pdf_files.id", ondelete="CASCADE"), index=True)
+    engine = Column(String, nullable=False)  # Движок извлечения таблиц, которым получен результат
+    created_at = Column(DateTime)
+    html_size = Column(Integer)  # Размер HTML без сжатия
+    # Готовые варианты под Accept-Encoding, сжимаются один раз при записи в кэш
+    html_zstd = Column(LargeBinary)
+    html_br = Column(LargeBinary)
+    html_gzip = Column(LargeBinary)
+    tables_zstd = Column(LargeBinary)  # Извлечённые таблицы в JSON, сжатые zstd — для экспорта
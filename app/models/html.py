@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, Text, String, DateTime
+from sqlalchemy import Boolean, Column, Integer, LargeBinary, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
 
 from app.database import Base
 
@@ -8,7 +9,52 @@ class HTMLFile(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
-    content = Column(Text)  # Храним HTML как текст
     source_pdf_id = Column(Integer, nullable=True)  # Связь с исходным PDF
     upload_date = Column(DateTime)
-    file_size = Column(Integer)
\ No newline at end of file
+    file_size = Column(Integer)  # Размер последней версии без сжатия
+    revision = Column(Integer, default=1)
+    page_count = Column(Integer, default=0)
+
+    # Последняя версия HTML хранится фрагментами: шапка, страницы, хвост
+    pages = relationship(
+        "HTMLPage",
+        back_populates="html_file",
+        cascade="all, delete-orphan",
+        order_by="HTMLPage.page_number",
+    )
+    revisions = relationship(
+        "HTMLRevision",
+        back_populates="html_file",
+        cascade="all, delete-orphan",
+        order_by="HTMLRevision.revision",
+    )
+
+
+class HTMLPage(Base):
+    __tablename__ = "html_pages"
+    __table_args__ = (UniqueConstraint("html_file_id", "page_number"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    html_file_id = Column(Integer, ForeignKey("html_files.id", ondelete="CASCADE"), index=True)
+    # 0 — всё до первой страницы, 1..page_count — <div class="page">, page_count + 1 — </body> и дальше
+    page_number = Column(Integer, nullable=False)
+    content = Column(LargeBinary)  # Фрагмент HTML, сжатый zstd
+    file_size = Column(Integer)  # Размер фрагмента без сжатия
+
+    html_file = relationship("HTMLFile", back_populates="pages")
+
+
+class HTMLRevision(Base):
+    __tablename__ = "html_revisions"
+    __table_args__ = (UniqueConstraint("html_file_id", "revision"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    html_file_id = Column(Integer, ForeignKey("html_files.id", ondelete="CASCADE"), index=True)
+    revision = Column(Integer, nullable=False)
+    is_snapshot = Column(Boolean, default=False)  # Полный снимок или дельта к предыдущей ревизии
+    page_number = Column(Integer, nullable=True)  # Если задан, дельта относится только к этому фрагменту
+    payload = Column(LargeBinary)  # zstd: снимок целиком или дельта со словарём из предыдущей версии
+    file_size = Column(Integer)  # Размер ревизии без сжатия
+    created_at = Column(DateTime)
+
+    html_file = relationship("HTMLFile", back_populates="revisions")
@@ -11,3 +11,4 @@ class PDFFile(Base):
     content = Column(LargeBinary)
     upload_date = Column(String)
     file_size = Column(Integer)
+    content_hash = Column(String(64), index=True)  # sha256 содержимого, ключ кэша превью
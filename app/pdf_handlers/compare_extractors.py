@@ -0,0 +1,133 @@
+# === Сравнение движков извлечения таблиц по скорости и совпадению ячеек ===
+# python -m app.pdf_handlers.compare_extractors [папка с PDF] [--reference camelot-lattice] [--threshold 0.9]
+
+import argparse
+import time
+from io import BytesIO
+from pathlib import Path
+
+import pdfplumber
+
+from app.pdf_handlers.converter import bbox_overlap
+from app.pdf_handlers.extractors import EXTRACTORS, get_extractor
+
+PDF_DIR = Path(__file__).resolve().parent.parent / "pdfs"
+
+
+def extract_all(content: bytes, engine: str) -> tuple[list, float]:
+    """Извлекает таблицы со всех страниц, возвращает таблицы и время в секундах"""
+    extractor = get_extractor(engine)
+    pdf_file = BytesIO(content)
+    tables = []
+
+    started = time.perf_counter()
+    with pdfplumber.open(pdf_file) as pdf:
+        for page_num, page in enumerate(pdf.pages, start=1):
+            tables.extend(extractor.extract(pdf_file, page, page_num))
+    return tables, time.perf_counter() - started
+
+
+def normalize_cell(cell) -> str:
+    return " ".join(str(cell or "").split())
+
+
+def cell_count(table) -> int:
+    return sum(len(row) for row in table.rows)
+
+
+def matching_cells(reference, candidate) -> int:
+    """Число ячеек с одинаковым текстом на одинаковых позициях"""
+    matches = 0
+    for ref_row, cand_row in zip(reference.rows, candidate.rows):
+        for ref_cell, cand_cell in zip(ref_row, cand_row):
+            if normalize_cell(ref_cell) == normalize_cell(cand_cell):
+                matches += 1
+    return matches
+
+
+def bbox_iou(bbox1, bbox2) -> float:
+    if not bbox_overlap(bbox1, bbox2):
+        return 0.0
+    x0, top = max(bbox1[0], bbox2[0]), max(bbox1[1], bbox2[1])
+    x1, bottom = min(bbox1[2], bbox2[2]), min(bbox1[3], bbox2[3])
+    intersection = (x1 - x0) * (bottom - top)
+    area1 = (bbox1[2] - bbox1[0]) * (bbox1[3] - bbox1[1])
+    area2 = (bbox2[2] - bbox2[0]) * (bbox2[3] - bbox2[1])
+    return intersection / (area1 + area2 - intersection)
+
+
+def cell_agreement(reference: list, candidate: list) -> tuple[int, int]:
+    """Совпавшие и все ячейки: таблицы сопоставляются по странице и пересечению bbox,
+    лишние и пропущенные таблицы идут в знаменатель"""
+    unmatched = list(candidate)
+    matched, total = 0, 0
+
+    for ref_table in reference:
+        same_page = [t for t in unmatched if t.page == ref_table.page]
+        best = max(same_page, key=lambda t: bbox_iou(ref_table.bbox, t.bbox), default=None)
+        if best is None or bbox_iou(ref_table.bbox, best.bbox) == 0:
+            total += cell_count(ref_table)
+            continue
+        unmatched.remove(best)
+        matched += matching_cells(ref_table, best)
+        total += max(cell_count(ref_table), cell_count(best))
+
+    total += sum(cell_count(t) for t in unmatched)
+    return matched, total
+
+
+def compare(pdf_dir: Path, reference: str, engines: list) -> dict:
+    """Прогоняет все движки по всем PDF, возвращает {engine: {"seconds", "agreement", "cells", "tables"}}.
+    Совпадение считается по ячейкам всего корпуса, а не средним по файлам: PDF без таблиц
+    ничего не добавляют и не завышают оценку"""
+    stats = {engine: {"seconds": 0.0, "matched": 0, "cells": 0, "tables": 0} for engine in engines}
+
+    for path in sorted(pdf_dir.glob("*.pdf")):
+        content = path.read_bytes()
+        results = {engine: extract_all(content, engine) for engine in engines}
+        reference_tables = results[reference][0] if reference in results else extract_all(content, reference)[0]
+
+        for engine in engines:
+            tables, seconds = results[engine]
+            matched, total = cell_agreement(reference_tables, tables)
+            stats[engine]["seconds"] += seconds
+            stats[engine]["matched"] += matched
+            stats[engine]["cells"] += total
+            stats[engine]["tables"] += len(tables)
+            print(f"{path.name:<28} {engine:<16} tables={len(tables):<3} "
+                  f"cells={matched}/{total} time={seconds:.2f}s")
+
+    for engine in engines:
+        s = stats[engine]
+        s["agreement"] = s["matched"] / s["cells"] if s["cells"] else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare table extraction engines")
+    parser.add_argument("pdf_dir", nargs="?", default=PDF_DIR, type=Path)
+    parser.add_argument("--reference", default="camelot-lattice", choices=list(EXTRACTORS))
+    parser.add_argument("--threshold", default=0.9, type=float,
+                        help="minimal corpus-wide cell agreement for an engine to be recommended")
+    args = parser.parse_args()
+
+    engines = list(EXTRACTORS)
+    stats = compare(args.pdf_dir, args.reference, engines)
+
+    print()
+    print(f"{'engine':<16} {'time, s':>8} {'agreement':>10} {'cells':>12} {'tables':>7}")
+    for engine in sorted(engines, key=lambda e: stats[e]["seconds"]):
+        s = stats[engine]
+        cells = f"{s['matched']}/{s['cells']}"
+        print(f"{engine:<16} {s['seconds']:>8.2f} {s['agreement']:>10.3f} {cells:>12} {s['tables']:>7}")
+
+    accurate = [e for e in engines if stats[e]["agreement"] >= args.threshold]
+    if accurate:
+        fastest = min(accurate, key=lambda e: stats[e]["seconds"])
+        print(f"\nFastest engine with agreement >= {args.threshold}: {fastest}")
+    else:
+        print(f"\nNo engine reaches agreement {args.threshold} against {args.reference}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+from io import BytesIO
+
+import pdfplumber
+import pypdfium2
+
+from app.pdf_handlers.extractors import DEFAULT_ENGINE, ExtractedTable, get_extractor
+
+
+HTML_HEAD = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <title>PDF Conversion</title>
+            <style>
+                body { font-family: Arial, sans-serif; line-height: 1.5; }
+                table { border-collapse: collapse; margin: 20px 0; }
+                th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+                th { background-color: #f2f2f2; }
+                .page { page-break-after: always; margin-bottom: 50px; }
+                .page-number { font-weight: bold; margin-top: 20px; }
+                .text-content { margin: 10px 0; }
+            </style>
+        </head>
+        <body>
+        """
+
+HTML_TAIL = """
+        </body>
+        </html>
+        """
+
+
+def convert_pdf(content: bytes, engine: str = DEFAULT_ENGINE) -> tuple[str, list[ExtractedTable]]:
+    """Конвертирует PDF в HTML (таблицы выбранным движком, остальной текст через pdfplumber)
+    и возвращает извлечённые таблицы для экспорта"""
+    extractor = get_extractor(engine)
+    html_content = HTML_HEAD
+    extracted_tables = []
+
+    pdf_file = BytesIO(content)
+
+    with pdfplumber.open(pdf_file) as pdf:
+        for page_num, page in enumerate(pdf.pages, start=1):
+            html_content += f'<div class="page" id="page-{page_num}">'
+            html_content += f'<div class="page-number">Page {page_num}</div>'
+
+            tables = extractor.extract(pdf_file, page, page_num)
+            extracted_tables.extend(tables)
+
+            table_bboxes = []
+            for table in tables:
+                table_bboxes.append(table.bbox)
+
+                html_content += '<table>'
+                for row in table.rows:
+                    html_content += '<tr>'
+                    for cell in row:
+                        html_content += f'<td>{cell}</td>'
+                    html_content += '</tr>'
+                html_content += '</table>'
+
+            words = page.extract_words()
+            if words:
+                filtered_words = []
+                for word in words:
+                    word_bbox = (word['x0'], word['top'], word['x1'], word['bottom'])
+                    in_table = False
+                    for table_bbox in table_bboxes:
+                        if bbox_overlap(word_bbox, table_bbox):
+                            in_table = True
+                            break
+                    if not in_table:
+                        filtered_words.append(word)
+
+                if filtered_words:
+                    formatted_text = format_text(filtered_words)
+                    html_content += f'<div class="text-content">{formatted_text}</div>'
+
+            html_content += '</div>'
+            # Сбрасываем кэш разметки страницы, иначе память растёт на длинных документах
+            page.close()
+
+    html_content += HTML_TAIL
+
+    return html_content, extracted_tables
+
+
+def count_pages(content: bytes) -> int:
+    """Быстро считает страницы, не разбирая их содержимое"""
+    pdf = pypdfium2.PdfDocument(content)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def bbox_overlap(bbox1, bbox2):
+    """Проверяет пересекаются ли два bounding box"""
+    x1_1, y1_1, x2_1, y2_1 = bbox1
+    x1_2, y1_2, x2_2, y2_2 = bbox2
+
+    # Проверка на пересечение по x и y
+    overlap_x = x1_1 < x2_2 and x2_1 > x1_2
+    overlap_y = y1_1 < y2_2 and y2_1 > y1_2
+
+    return overlap_x and overlap_y
+
+
+def format_text(words):
+    """Форматирует список слов в читаемый текст"""
+    words = sorted(words, key=lambda w: (w['top'], w['x0']))
+
+    lines = []
+    current_line = []
+    current_top = None
+
+    for word in words:
+        if current_top is None or abs(word['top'] - current_top) < 5:
+            current_line.append(word)
+            current_top = word['top']
+        else:
+            lines.append(format_line(current_line))
+            current_line = [word]
+            current_top = word['top']
+
+    if current_line:
+        lines.append(format_line(current_line))
+
+    return "<br>".join(lines)
+
+
+def format_line(words):
+    """Форматирует строку текста"""
+    line_text = ""
+    prev_x1 = None
+
+    for word in sorted(words, key=lambda w: w['x0']):
+        if prev_x1 and word['x0'] - prev_x1 > 10:
+            line_text += "    "
+        elif prev_x1:
+            line_text += " "
+        line_text += word['text']
+        prev_x1 = word['x1']
+
+    return line_text
@@ -0,0 +1,92 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from io import BytesIO
+
+import camelot
+
+
+@dataclass
+class ExtractedTable:
+    page: int
+    index: int
+    bbox: tuple  # (x0, top, x1, bottom) в координатах pdfplumber — начало сверху слева
+    rows: list
+
+
+class TableExtractor(ABC):
+    """Интерфейс движка извлечения таблиц со страницы"""
+
+    name = ""
+
+    @abstractmethod
+    def extract(self, pdf_file: BytesIO, page, page_num: int) -> list[ExtractedTable]:
+        ...
+
+
+class CamelotExtractor(TableExtractor):
+    """camelot: lattice ищет линии на растре страницы (ghostscript), stream — по пробелам"""
+
+    def __init__(self, flavor: str):
+        self.flavor = flavor
+        self.name = f"camelot-{flavor}"
+
+    def extract(self, pdf_file: BytesIO, page, page_num: int) -> list[ExtractedTable]:
+        tables = camelot.read_pdf(pdf_file, pages=str(page_num), flavor=self.flavor)
+
+        result = []
+        for index, table in enumerate(tables):
+            # camelot считает y снизу страницы
+            x1, y1, x2, y2 = table._bbox
+            bbox = (x1, page.height - y2, x2, page.height - y1)
+            result.append(ExtractedTable(page=page_num, index=index, bbox=bbox, rows=table.data))
+        return result
+
+
+class PlumberExtractor(TableExtractor):
+    """pdfplumber: таблицы по векторным линиям уже открытой страницы, без растеризации"""
+
+    name = "pdfplumber"
+
+    def extract(self, pdf_file: BytesIO, page, page_num: int) -> list[ExtractedTable]:
+        result = []
+        for index, table in enumerate(page.find_tables()):
+            rows = [[cell or "" for cell in row] for row in table.extract()]
+            result.append(ExtractedTable(page=page_num, index=index, bbox=table.bbox, rows=rows))
+        return result
+
+
+class AutoExtractor(TableExtractor):
+    """Выбор движка по странице: сначала pdfplumber по векторным линиям; если он таблиц не нашёл,
+    а на странице есть картинки — camelot-lattice (таблица может быть только на скане)"""
+
+    name = "auto"
+
+    def __init__(self):
+        self.vector = PlumberExtractor()
+        self.raster = CamelotExtractor("lattice")
+
+    def extract(self, pdf_file: BytesIO, page, page_num: int) -> list[ExtractedTable]:
+        # Одиночная линия (подчёркивание заголовка) не делает страницу векторной таблицей,
+        # поэтому решаем по тому, нашёл ли pdfplumber таблицы, а не по наличию линий
+        tables = self.vector.extract(pdf_file, page, page_num)
+        if tables or not page.images:
+            return tables
+        return self.raster.extract(pdf_file, page, page_num)
+
+
+EXTRACTORS = {
+    "camelot-lattice": lambda: CamelotExtractor("lattice"),
+    "camelot-stream": lambda: CamelotExtractor("stream"),
+    "pdfplumber": PlumberExtractor,
+    "auto": AutoExtractor,
+}
+
+# По compare_extractors на app/pdfs (по ячейкам всего корпуса): pdfplumber совпадает с camelot-lattice
+# в 159 из 159 ячеек (3 таблицы) и в ~7 раз быстрее. Выборка маленькая и без сканов — для сканов есть auto
+DEFAULT_ENGINE = "pdfplumber"
+
+
+def get_extractor(engine: str) -> TableExtractor:
+    if engine not in EXTRACTORS:
+        raise ValueError(f"Unknown table engine '{engine}', available: {', '.join(EXTRACTORS)}")
+    return EXTRACTORS[engine]()
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+import pypdfium2
+from PIL import Image
+
+from app.metrics import counter
+
+THUMB_CACHE_DIR = Path(os.getenv("THUMB_CACHE_DIR", os.path.join(tempfile.gettempdir(), "mts-thumbs")))
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "2"))
+# Сколько первых страниц рендерить сразу при загрузке PDF (0 — не рендерить)
+THUMB_PREGENERATE_PAGES = int(os.getenv("THUMB_PREGENERATE_PAGES", "0"))
+THUMB_DEFAULT_WIDTH = 200
+THUMB_MIN_WIDTH = 16
+THUMB_MAX_WIDTH = 2000
+
+FORMATS = {"webp": "image/webp", "png": "image/png"}
+
+thumbnail_requests = counter("thumbnail_requests_total", "Page thumbnail requests by cache result")
+
+_executor = None
+_inflight = {}
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def source_path(pdf_hash: str) -> Path:
+    return THUMB_CACHE_DIR / pdf_hash[:2] / pdf_hash / "source.pdf"
+
+
+def thumbnail_path(pdf_hash: str, page_number: int, width: int, fmt: str) -> Path:
+    return THUMB_CACHE_DIR / pdf_hash[:2] / pdf_hash / f"p{page_number}_w{width}.{fmt}"
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def ensure_source(pdf_hash: str, content: bytes) -> Path:
+    """Кладёт PDF рядом с превью, чтобы воркеры читали файл, а не получали байты через pickle"""
+    path = source_path(pdf_hash)
+    if not path.exists():
+        _write_atomic(path, content)
+    return path
+
+
+@lru_cache(maxsize=1024)
+def page_count(pdf_hash: str) -> int:
+    """Число страниц PDF из кэша превью; PDF неизменяем по хешу, поэтому результат кэшируется"""
+    pdf = pypdfium2.PdfDocument(str(source_path(pdf_hash)))
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def render_pages(pdf_hash: str, page_numbers: list, width: int, fmt: str) -> list:
+    """Рендерит страницы в файлы кэша (выполняется в процессе-воркере)"""
+    pdf = pypdfium2.PdfDocument(str(source_path(pdf_hash)))
+    try:
+        rendered = []
+        for page_number in page_numbers:
+            if not 1 <= page_number <= len(pdf):
+                raise IndexError(f"Page {page_number} not found")
+
+            path = thumbnail_path(pdf_hash, page_number, width, fmt)
+            if path.exists():
+                rendered.append(str(path))
+                continue
+
+            page = pdf[page_number - 1]
+            try:
+                bitmap = page.render(scale=width / page.get_width())
+                image = bitmap.to_pil()
+            finally:
+                page.close()
+
+            if image.width != width:
+                image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+            buffer = BytesIO()
+            if fmt == "webp":
+                image.save(buffer, format="WEBP", quality=80, method=4)
+            else:
+                image.save(buffer, format="PNG", optimize=True)
+            _write_atomic(path, buffer.getvalue())
+            rendered.append(str(path))
+        return rendered
+    finally:
+        pdf.close()
+
+
+def render_first_pages(pdf_hash: str, count: int, width: int, fmt: str) -> list:
+    pdf = pypdfium2.PdfDocument(str(source_path(pdf_hash)))
+    try:
+        page_count = len(pdf)
+    finally:
+        pdf.close()
+    return render_pages(pdf_hash, list(range(1, min(count, page_count) + 1)), width, fmt)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # pdfium не потокобезопасен, поэтому рендер идёт в отдельных процессах
+        _executor = ProcessPoolExecutor(
+            max_workers=THUMB_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def _submit(fn, *args):
+    """Отправляет задачу в пул; если воркер упал и пул сломан — пересоздаёт его"""
+    global _executor
+    try:
+        return get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        _executor = None
+        return get_executor().submit(fn, *args)
+
+
+async def get_thumbnail(pdf_hash: str, page_number: int, width: int, fmt: str) -> Path:
+    """Возвращает путь к превью; одинаковые параллельные запросы ждут один рендер"""
+    path = thumbnail_path(pdf_hash, page_number, width, fmt)
+    if path.exists():
+        thumbnail_requests.inc(result="hit")
+        return path
+
+    thumbnail_requests.inc(result="miss")
+    future = _inflight.get(path)
+    if future is None:
+        future = asyncio.wrap_future(_submit(render_pages, pdf_hash, [page_number], width, fmt))
+        _inflight[path] = future
+        future.add_done_callback(lambda _: _inflight.pop(path, None))
+    await asyncio.shield(future)
+    return path
+
+
+def pregenerate(pdf_hash: str, count: int = THUMB_PREGENERATE_PAGES,
+                width: int = THUMB_DEFAULT_WIDTH, fmt: str = "webp") -> None:
+    """Ставит в пул рендер первых страниц без ожидания результата"""
+    if count > 0:
+        _submit(render_first_pages, pdf_hash, count, width, fmt)
+
+
+def negotiate_format(accept: str) -> str:
+    return "webp" if "image/webp" in accept else "png"
@@ -0,0 +1,201 @@
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from app.metrics import counter, summary
+
+CONVERSION_TIMEOUT_SECONDS = float(os.getenv("CONVERSION_TIMEOUT_SECONDS", "120"))
+CONVERSION_MAX_RSS_MB = int(os.getenv("CONVERSION_MAX_RSS_MB", "1024"))
+# Воркер перезапускается после N задач или если после задачи занимает больше M МБ
+WORKER_MAX_TASKS = int(os.getenv("WORKER_MAX_TASKS", "50"))
+WORKER_RECYCLE_RSS_MB = int(os.getenv("WORKER_RECYCLE_RSS_MB", "512"))
+POLL_INTERVAL = 0.25
+
+conversion_failures = counter("conversion_failures_total", "Conversions that did not produce a result")
+workers_recycled = counter("conversion_workers_recycled_total", "Conversion worker processes replaced")
+conversion_seconds = summary("conversion_seconds", "Wall-clock time of a conversion in a worker")
+
+logger = logging.getLogger(__name__)
+
+
+class ConversionFailed(Exception):
+    """Документ не сконвертирован: timeout, memory_limit, crashed или error — проблема документа;
+    unavailable — сбой на стороне супервизора (воркеру не удалось передать задачу)"""
+
+    def __init__(self, reason: str, detail: str, elapsed: float):
+        super().__init__(detail)
+        self.reason = reason
+        self.detail = detail
+        self.elapsed = elapsed
+
+    @property
+    def is_document_error(self) -> bool:
+        return self.reason != "unavailable"
+
+    def to_dict(self) -> dict:
+        return {
+            "error": "conversion_failed",
+            "reason": self.reason,
+            "detail": self.detail,
+            "elapsed_seconds": round(self.elapsed, 2),
+        }
+
+
+def _rss_bytes(pid: int) -> int:
+    """RSS процесса вместе с дочерними (ghostscript и т.п.) по /proc; 0, если /proc недоступен"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            rss = next((int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:")), 0)
+    except (OSError, ValueError):
+        return 0
+
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, ValueError):
+        children = []
+    return rss + sum(_rss_bytes(child) for child in children)
+
+
+def _worker_main(conn) -> None:
+    """Цикл процесса-воркера: получает (content, engine), отвечает ("ok", (html, tables)) или ("error", текст)"""
+    # Своя группа процессов, чтобы при убийстве воркера завершались и его дочерние процессы
+    os.setsid()
+    from app.pdf_handlers.converter import convert_pdf
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        content, engine = task
+        try:
+            conn.send(("ok", convert_pdf(content, engine)))
+        except Exception as e:
+            conn.send(("error", str(e)))
+        finally:
+            del content
+            gc.collect()
+
+
+class _Worker:
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class ConversionSupervisor:
+    """Выполняет конвертацию в отдельных процессах с ограничением времени и памяти.
+    Зависший или разросшийся воркер убивается, документ возвращается как ConversionFailed,
+    а воркер заменяется новым — API при этом продолжает работать"""
+
+    def __init__(self, timeout: float, max_rss_mb: int, max_tasks: int, recycle_rss_mb: int):
+        self.timeout = timeout
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.max_tasks = max_tasks
+        self.recycle_rss = recycle_rss_mb * 1024 * 1024
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> _Worker:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.conn.close()
+        return _Worker()
+
+    def _checkin(self, worker: _Worker) -> None:
+        worker.tasks += 1
+        rss = _rss_bytes(worker.process.pid)
+        if worker.tasks >= self.max_tasks:
+            workers_recycled.inc(reason="max_tasks")
+            worker.stop()
+        elif rss > self.recycle_rss:
+            workers_recycled.inc(reason="rss")
+            worker.stop()
+        else:
+            with self._lock:
+                self._idle.append(worker)
+
+    def _fail(self, worker: _Worker, reason: str, detail: str, started: float) -> ConversionFailed:
+        elapsed = time.monotonic() - started
+        worker.kill()
+        workers_recycled.inc(reason=reason)
+        conversion_failures.inc(reason=reason)
+        logger.warning("Conversion failed (%s): %s after %.1fs", reason, detail, elapsed)
+        return ConversionFailed(reason, detail, elapsed)
+
+    def convert(self, content: bytes, engine: str) -> tuple:
+        """Блокирующий вызов: возвращает (html, таблицы) или бросает ConversionFailed"""
+        worker = self._checkout()
+        started = time.monotonic()
+        try:
+            worker.conn.send((content, engine))
+        except (BrokenPipeError, OSError) as e:
+            raise self._fail(worker, "unavailable", f"Worker unavailable: {e}", started)
+
+        while not worker.conn.poll(POLL_INTERVAL):
+            elapsed = time.monotonic() - started
+            if not worker.process.is_alive():
+                raise self._fail(worker, "crashed", f"Worker exited with code {worker.process.exitcode}", started)
+            if elapsed > self.timeout:
+                raise self._fail(worker, "timeout", f"Conversion exceeded {self.timeout:.0f}s", started)
+            rss = _rss_bytes(worker.process.pid)
+            if rss > self.max_rss:
+                raise self._fail(
+                    worker, "memory_limit",
+                    f"Worker RSS {rss // (1024 * 1024)} MB exceeded {self.max_rss // (1024 * 1024)} MB",
+                    started,
+                )
+
+        try:
+            status, payload = worker.conn.recv()
+        except (EOFError, OSError):
+            raise self._fail(worker, "crashed", f"Worker exited with code {worker.process.exitcode}", started)
+
+        conversion_seconds.observe(time.monotonic() - started, engine=engine)
+        self._checkin(worker)
+        if status == "error":
+            conversion_failures.inc(reason="error")
+            raise ConversionFailed("error", payload, time.monotonic() - started)
+        return payload
+
+
+conversion_supervisor = ConversionSupervisor(
+    CONVERSION_TIMEOUT_SECONDS,
+    CONVERSION_MAX_RSS_MB,
+    WORKER_MAX_TASKS,
+    WORKER_RECYCLE_RSS_MB,
+)
@@ -0,0 +1,217 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, status
+
+from app.metrics import counter, summary
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)
+
+CONVERSION_CONCURRENCY = int(os.getenv("CONVERSION_CONCURRENCY", "2"))
+# Сколько слотов batch-запросы не могут занять — под них всегда остаётся место для интерактивных
+INTERACTIVE_RESERVED = int(os.getenv("CONVERSION_INTERACTIVE_RESERVED", "1"))
+MAX_QUEUED_PER_USER = int(os.getenv("CONVERSION_MAX_QUEUED_PER_USER", "20"))
+UPLOADS_PER_MINUTE = float(os.getenv("UPLOADS_PER_MINUTE", "30"))
+UPLOAD_BURST = int(os.getenv("UPLOAD_BURST", "10"))
+PAGES_PER_MINUTE = float(os.getenv("CONVERSION_PAGES_PER_MINUTE", "300"))
+PAGES_BURST = int(os.getenv("CONVERSION_PAGES_BURST", "300"))
+# Объём страниц, который пользователь может конвертировать в полосе interactive; сверх него — batch
+INTERACTIVE_PAGES_PER_MINUTE = float(os.getenv("CONVERSION_INTERACTIVE_PAGES_PER_MINUTE", "60"))
+INTERACTIVE_PAGES_BURST = int(os.getenv("CONVERSION_INTERACTIVE_PAGES_BURST", "60"))
+# Веса пользователей в справедливой очереди: "user_id:weight,..."; у остальных вес 1
+USER_WEIGHTS = os.getenv("CONVERSION_USER_WEIGHTS", "")
+
+queue_wait_seconds = summary("conversion_queue_wait_seconds", "Time a conversion waited for a worker slot")
+rate_limited = counter("rate_limited_total", "Requests rejected by per-user limits")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate  # Токенов в секунду
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self, amount: float) -> float:
+        """Списывает токены; возвращает 0 при успехе или сколько секунд ждать"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        # Документ больше ёмкости корзины пропускаем, когда она полная, иначе он не пройдёт никогда
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def refund(self, amount: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+
+class UserRateLimiter:
+    """Отдельная корзина токенов на каждого пользователя"""
+
+    def __init__(self, name: str, per_minute: float, burst: int):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = burst
+        self._buckets = {}
+
+    def check(self, user_id: int, amount: float = 1) -> None:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+
+        retry_after = bucket.take(amount)
+        if retry_after > 0:
+            rate_limited.inc(limit=self.name)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Rate limit exceeded for {self.name}",
+                headers={"Retry-After": str(int(retry_after) + 1)},
+            )
+
+    def refund(self, user_id: int, amount: float = 1) -> None:
+        """Возвращает токены, если оплаченная работа так и не была выполнена"""
+        bucket = self._buckets.get(user_id)
+        if bucket is not None:
+            bucket.refund(amount)
+
+
+class LaneSelector:
+    """Полосу выбирает сервер, а не клиент: interactive, пока пользователь укладывается в небольшой
+    объём страниц; массовая конвертация исчерпывает его и уходит в batch. Клиент может только понизить полосу"""
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self._buckets = {}
+
+    def choose(self, user_id: int, requested: str, pages: int) -> str:
+        if requested == BATCH or pages > self.burst:
+            return BATCH
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        return INTERACTIVE if bucket.take(pages) == 0 else BATCH
+
+
+def parse_weights(value: str) -> dict:
+    weights = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        user_id, _, weight = item.partition(":")
+        weights[int(user_id)] = float(weight)
+    return weights
+
+
+def user_weight(user_id: int) -> float:
+    """Вес пользователя: при весе 2 он получает вдвое больше страниц конвертации, чем пользователь с весом 1"""
+    return _user_weights.get(user_id, 1.0)
+
+
+class FairScheduler:
+    """Ограничивает число одновременных конвертаций и раздаёт слоты по справедливой очереди:
+    внутри полосы — start-time fair queuing по пользователям (стоимость — страницы),
+    между полосами — interactive раньше batch, и batch не занимает зарезервированные слоты"""
+
+    def __init__(self, concurrency: int, interactive_reserved: int, max_queued_per_user: int):
+        if concurrency < 1:
+            raise ValueError(f"CONVERSION_CONCURRENCY must be at least 1, got {concurrency}")
+        if not 0 <= interactive_reserved < concurrency:
+            raise ValueError(
+                f"CONVERSION_INTERACTIVE_RESERVED must be between 0 and CONVERSION_CONCURRENCY - 1 "
+                f"({concurrency - 1}), got {interactive_reserved}"
+            )
+        self.concurrency = concurrency
+        self.batch_limit = concurrency - interactive_reserved
+        self.max_queued_per_user = max_queued_per_user
+        self.running = {lane: 0 for lane in LANES}
+        self._queues = {lane: [] for lane in LANES}
+        self._finish_tags = {lane: {} for lane in LANES}
+        self._virtual_time = {lane: 0.0 for lane in LANES}
+        self._queued_per_user = {}
+        self._sequence = itertools.count()
+
+    def _can_start(self, lane: str) -> bool:
+        if sum(self.running.values()) >= self.concurrency:
+            return False
+        if lane == BATCH:
+            return self.running[BATCH] < self.batch_limit and not self._queues[INTERACTIVE]
+        return True
+
+    def _start_tag(self, lane: str, user_id: int, cost: float, weight: float) -> float:
+        start = max(self._virtual_time[lane], self._finish_tags[lane].get(user_id, 0.0))
+        self._finish_tags[lane][user_id] = start + cost / weight
+        return start
+
+    def _dispatch(self) -> None:
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue and self._can_start(lane):
+                start, _, user_id, future = heapq.heappop(queue)
+                if future.cancelled():
+                    continue
+                self._queued_per_user[user_id] -= 1
+                self.running[lane] += 1
+                self._virtual_time[lane] = start
+                future.set_result(None)
+
+    async def _acquire(self, user_id: int, lane: str, cost: float, weight: float) -> None:
+        if not self._queues[lane] and self._can_start(lane):
+            self.running[lane] += 1
+            self._virtual_time[lane] = self._start_tag(lane, user_id, cost, weight)
+            return
+
+        if self._queued_per_user.get(user_id, 0) >= self.max_queued_per_user:
+            rate_limited.inc(limit="queue")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many queued conversions",
+                headers={"Retry-After": "5"},
+            )
+
+        start = self._start_tag(lane, user_id, cost, weight)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[lane], (start, next(self._sequence), user_id, future))
+        self._queued_per_user[user_id] = self._queued_per_user.get(user_id, 0) + 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже выдан, но клиент ушёл — возвращаем его следующему
+                self._release(lane)
+            else:
+                future.cancel()
+                self._queued_per_user[user_id] -= 1
+                self._dispatch()
+            raise
+
+    def _release(self, lane: str) -> None:
+        self.running[lane] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, lane: str = INTERACTIVE, cost: float = 1, weight: float = 1.0):
+        started = time.monotonic()
+        await self._acquire(user_id, lane, cost, weight)
+        queue_wait_seconds.observe(time.monotonic() - started, lane=lane)
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+
+_user_weights = parse_weights(USER_WEIGHTS)
+upload_limiter = UserRateLimiter("uploads", UPLOADS_PER_MINUTE, UPLOAD_BURST)
+conversion_pages_limiter = UserRateLimiter("conversion pages", PAGES_PER_MINUTE, PAGES_BURST)
+lane_selector = LaneSelector(INTERACTIVE_PAGES_PER_MINUTE, INTERACTIVE_PAGES_BURST)
+conversion_scheduler = FairScheduler(CONVERSION_CONCURRENCY, INTERACTIVE_RESERVED, MAX_QUEUED_PER_USER)
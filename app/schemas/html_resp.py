@@ -10,6 +10,8 @@ class HTMLFileResponse(BaseModel):
     upload_date: datetime
     file_size: int
     source_pdf_id: Optional[int] = None
+    revision: int = 1
+    page_count: int = 0
 
     class Config:
         orm_mode = True
@@ -18,4 +20,17 @@ class HTMLFileResponse(BaseModel):
 class HTMLFileCreate(BaseModel):
     filename: str
     content: str
-    source_pdf_id: Optional[int] = None
\ No newline at end of file
+    source_pdf_id: Optional[int] = None
+
+
+class HTMLPagePatch(BaseModel):
+    content: str
+
+
+class HTMLRevisionResponse(BaseModel):
+    revision: int
+    is_snapshot: bool
+    page_number: Optional[int] = None
+    file_size: int
+    stored_size: int
+    created_at: datetime
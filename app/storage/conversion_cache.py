@@ -0,0 +1,56 @@
+import json
+from dataclasses import asdict
+from datetime import datetime
+from typing import Optional
+
+import zstandard
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.compression import ENCODINGS, compress, decompress
+from app.models.conversion import ConversionResult
+
+# Таблицы — данные для экспорта, а не вариант ответа, поэтому сжимаются мимо метрик app.compression
+TABLES_ZSTD_LEVEL = 3
+
+
+def get_cached_result(db: Session, pdf_id: int, engine: str) -> Optional[ConversionResult]:
+    return (
+        db.query(ConversionResult)
+        .filter(ConversionResult.pdf_id == pdf_id, ConversionResult.engine == engine)
+        .first()
+    )
+
+
+def store_result(db: Session, pdf_id: int, engine: str, html: str, tables: list) -> ConversionResult:
+    """Сохраняет результат конвертации сразу во всех кодировках вместе с таблицами"""
+    raw = html.encode('utf-8')
+    tables_json = json.dumps([asdict(table) for table in tables], ensure_ascii=False).encode('utf-8')
+    result = ConversionResult(
+        pdf_id=pdf_id,
+        engine=engine,
+        created_at=datetime.now(),
+        html_size=len(raw),
+        tables_zstd=zstandard.ZstdCompressor(level=TABLES_ZSTD_LEVEL).compress(tables_json),
+        **{f"html_{encoding}": compress(raw, encoding) for encoding in ENCODINGS},
+    )
+    db.add(result)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Тот же PDF параллельно сконвертировал другой запрос — берём его результат
+        db.rollback()
+        return get_cached_result(db, pdf_id, engine)
+    db.refresh(result)
+    return result
+
+
+def get_variant(result: ConversionResult, encoding: str) -> bytes:
+    """Отдаёт готовый сжатый вариант; для identity распаковывает zstd"""
+    if encoding == "identity":
+        return decompress(result.html_zstd, "zstd")
+    return getattr(result, f"html_{encoding}")
+
+
+def load_tables(tables_zstd: bytes) -> list[dict]:
+    return json.loads(zstandard.ZstdDecompressor().decompress(tables_zstd))
@@ -0,0 +1,266 @@
+import re
+from datetime import datetime
+from typing import Optional
+
+import zstandard
+from sqlalchemy.orm import Session
+
+from app.models.html import HTMLFile, HTMLPage, HTMLRevision
+
+ZSTD_LEVEL = 3
+# Каждая N-я ревизия хранится целиком, чтобы восстановление не проигрывало длинную цепочку дельт
+SNAPSHOT_INTERVAL = 10
+# Верхняя граница окна zstd (128 МБ) — иначе дельта не видит начало большого документа
+MAX_WINDOW_LOG = 27
+# Хеш-таблицы под размер базовой версии, иначе совпадения со словарём теряются; 2^24 — около 64 МБ на таблицу
+MAX_HASH_LOG = 24
+
+# Разметка страницы, которую выдаёт конвертер: <div class="page" id="page-N">
+PAGE_OPEN_RE = re.compile(r'<div\b[^>]*\bclass=["\']page["\'][^>]*>', re.IGNORECASE)
+BODY_CLOSE_RE = re.compile(r'</body', re.IGNORECASE)
+
+
+def compress_html(content: str) -> bytes:
+    """Сжимает HTML в zstd"""
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(content.encode('utf-8'))
+
+
+def decompress_html(data: bytes) -> str:
+    """Распаковывает HTML из zstd"""
+    return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+
+
+def _window_log(base: bytes, target: bytes) -> int:
+    return min(max((len(base) + len(target)).bit_length(), zstandard.WINDOWLOG_MIN), MAX_WINDOW_LOG)
+
+
+def make_delta(base: str, target: str) -> bytes:
+    """Кодирует target как дельту относительно base (base используется как словарь zstd)"""
+    base_bytes = base.encode('utf-8')
+    target_bytes = target.encode('utf-8')
+    window_log = _window_log(base_bytes, target_bytes)
+    params = zstandard.ZstdCompressionParameters.from_level(
+        ZSTD_LEVEL,
+        window_log=window_log,
+        hash_log=min(window_log, MAX_HASH_LOG),
+        chain_log=min(window_log, MAX_HASH_LOG),
+    )
+    compressor = zstandard.ZstdCompressor(
+        dict_data=zstandard.ZstdCompressionDict(base_bytes, dict_type=zstandard.DICT_TYPE_RAWCONTENT),
+        compression_params=params,
+    )
+    return compressor.compress(target_bytes)
+
+
+def apply_delta(base: str, delta: bytes) -> str:
+    """Восстанавливает текст по базовой версии и дельте"""
+    decompressor = zstandard.ZstdDecompressor(
+        dict_data=zstandard.ZstdCompressionDict(base.encode('utf-8'), dict_type=zstandard.DICT_TYPE_RAWCONTENT),
+        max_window_size=1 << MAX_WINDOW_LOG,
+    )
+    return decompressor.decompress(delta).decode('utf-8')
+
+
+def split_pages(content: str) -> list[str]:
+    """Делит HTML на фрагменты: шапка, страницы, хвост (склейка даёт исходный документ)"""
+    starts = [m.start() for m in PAGE_OPEN_RE.finditer(content)]
+    if not starts:
+        return [content, ""]
+
+    tail_start = len(content)
+    for m in BODY_CLOSE_RE.finditer(content, starts[-1]):
+        tail_start = m.start()
+
+    bounds = [0] + starts + [tail_start, len(content)]
+    return [content[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+def validate_page_fragment(content: str) -> str:
+    """Проверяет, что фрагмент — ровно одна страница и не ломает деление документа"""
+    content = content.lstrip()
+    pages = list(PAGE_OPEN_RE.finditer(content))
+    if len(pages) != 1 or pages[0].start() != 0:
+        raise ValueError('Fragment must contain exactly one <div class="page"> at its start')
+    if BODY_CLOSE_RE.search(content):
+        raise ValueError("Fragment must not contain </body>")
+    return content
+
+
+def _store_fragments(db_file: HTMLFile, fragments: list[str]) -> None:
+    """Перезаписывает только изменившиеся фрагменты"""
+    existing = {page.page_number: page for page in db_file.pages}
+    for page_number, fragment in enumerate(fragments):
+        compressed = compress_html(fragment)
+        page = existing.pop(page_number, None)
+        if page is None:
+            db_file.pages.append(HTMLPage(
+                page_number=page_number,
+                content=compressed,
+                file_size=len(fragment.encode('utf-8')),
+            ))
+        elif page.content != compressed:
+            page.content = compressed
+            page.file_size = len(fragment.encode('utf-8'))
+
+    for page in existing.values():
+        db_file.pages.remove(page)
+
+    db_file.page_count = len(fragments) - 2
+
+
+def create_html_file(db: Session, filename: str, content: str, source_pdf_id: Optional[int] = None) -> HTMLFile:
+    """Создаёт HTML-файл с первой ревизией-снимком"""
+    file_size = len(content.encode('utf-8'))
+    now = datetime.now()
+
+    db_file = HTMLFile(
+        filename=filename,
+        source_pdf_id=source_pdf_id,
+        upload_date=now,
+        file_size=file_size,
+        revision=1,
+    )
+    _store_fragments(db_file, split_pages(content))
+    db_file.revisions.append(HTMLRevision(
+        revision=1,
+        is_snapshot=True,
+        payload=compress_html(content),
+        file_size=file_size,
+        created_at=now,
+    ))
+    db.add(db_file)
+    return db_file
+
+
+def _next_revision(db_file: HTMLFile) -> tuple[int, bool]:
+    revision = db_file.revision + 1
+    return revision, (revision - 1) % SNAPSHOT_INTERVAL == 0
+
+
+def add_revision(db: Session, db_file: HTMLFile, content: str) -> HTMLFile:
+    """Сохраняет новую версию файла: дельту к предыдущей или периодический полный снимок"""
+    previous = get_latest_content(db_file)
+    revision, is_snapshot = _next_revision(db_file)
+    file_size = len(content.encode('utf-8'))
+    now = datetime.now()
+
+    payload = compress_html(content) if is_snapshot else make_delta(previous, content)
+
+    db.add(HTMLRevision(
+        html_file_id=db_file.id,
+        revision=revision,
+        is_snapshot=is_snapshot,
+        payload=payload,
+        file_size=file_size,
+        created_at=now,
+    ))
+    _store_fragments(db_file, split_pages(content))
+    db_file.revision = revision
+    db_file.file_size = file_size
+    db_file.upload_date = now
+    return db_file
+
+
+def get_page(db: Session, html_file_id: int, page_number: int) -> Optional[HTMLPage]:
+    return (
+        db.query(HTMLPage)
+        .filter(HTMLPage.html_file_id == html_file_id, HTMLPage.page_number == page_number)
+        .first()
+    )
+
+
+def patch_page(db: Session, db_file: HTMLFile, page_number: int, content: str) -> HTMLFile:
+    """Заменяет одну страницу; в ревизию пишется дельта только этого фрагмента"""
+    if not 1 <= page_number <= db_file.page_count:
+        raise LookupError(f"Page {page_number} not found")
+    page = get_page(db, db_file.id, page_number)
+    if page is None:
+        raise LookupError(f"Page {page_number} not found")
+    content = validate_page_fragment(content)
+
+    previous = decompress_html(page.content)
+    revision, is_snapshot = _next_revision(db_file)
+    file_size = db_file.file_size - page.file_size + len(content.encode('utf-8'))
+    now = datetime.now()
+
+    page.content = compress_html(content)
+    page.file_size = len(content.encode('utf-8'))
+
+    if is_snapshot:
+        # Периодический снимок требует собрать документ целиком, но только раз в SNAPSHOT_INTERVAL правок
+        db.flush()
+        payload = compress_html(get_latest_content(db_file))
+        revision_page = None
+    else:
+        payload = make_delta(previous, content)
+        revision_page = page_number
+
+    db.add(HTMLRevision(
+        html_file_id=db_file.id,
+        revision=revision,
+        is_snapshot=is_snapshot,
+        page_number=revision_page,
+        payload=payload,
+        file_size=file_size,
+        created_at=now,
+    ))
+    db_file.revision = revision
+    db_file.file_size = file_size
+    db_file.upload_date = now
+    return db_file
+
+
+def get_latest_content(db_file: HTMLFile) -> str:
+    """Собирает последнюю версию из фрагментов без проигрывания дельт"""
+    return "".join(decompress_html(page.content) for page in db_file.pages)
+
+
+def list_revisions(db: Session, html_file_id: int) -> list[HTMLRevision]:
+    return (
+        db.query(HTMLRevision)
+        .filter(HTMLRevision.html_file_id == html_file_id)
+        .order_by(HTMLRevision.revision)
+        .all()
+    )
+
+
+def get_revision_content(db: Session, db_file: HTMLFile, revision: int) -> Optional[str]:
+    """Восстанавливает ревизию: ближайший снимок и дельты после него"""
+    if revision == db_file.revision:
+        return get_latest_content(db_file)
+
+    snapshot = (
+        db.query(HTMLRevision)
+        .filter(
+            HTMLRevision.html_file_id == db_file.id,
+            HTMLRevision.is_snapshot.is_(True),
+            HTMLRevision.revision <= revision,
+        )
+        .order_by(HTMLRevision.revision.desc())
+        .first()
+    )
+    if snapshot is None:
+        return None
+
+    deltas = (
+        db.query(HTMLRevision)
+        .filter(
+            HTMLRevision.html_file_id == db_file.id,
+            HTMLRevision.revision > snapshot.revision,
+            HTMLRevision.revision <= revision,
+        )
+        .order_by(HTMLRevision.revision)
+        .all()
+    )
+    if len(deltas) != revision - snapshot.revision:
+        return None
+
+    content = decompress_html(snapshot.payload)
+    for delta in deltas:
+        if delta.page_number is None:
+            content = apply_delta(content, delta.payload)
+        else:
+            fragments = split_pages(content)
+            fragments[delta.page_number] = apply_delta(fragments[delta.page_number], delta.payload)
+            content = "".join(fragments)
+    return content
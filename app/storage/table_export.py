@@ -0,0 +1,124 @@
+import csv
+import io
+from typing import Iterable, Iterator
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy.orm import Session
+
+from app.models.conversion import ConversionResult
+from app.storage.conversion_cache import load_tables
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Одна ячейка — одна строка: таблицы разной ширины ложатся в общую схему
+COLUMNS = ("pdf_id", "page", "table_index", "x0", "top", "x1", "bottom", "row", "column", "value")
+BATCH_ROWS = 10_000
+
+SCHEMA = pa.schema([
+    ("pdf_id", pa.int32()),
+    ("page", pa.int32()),
+    ("table_index", pa.int32()),
+    ("x0", pa.float64()),
+    ("top", pa.float64()),
+    ("x1", pa.float64()),
+    ("bottom", pa.float64()),
+    ("row", pa.int32()),
+    ("column", pa.int32()),
+    ("value", pa.string()),
+])
+
+
+def missing_results(db: Session, pdf_ids: list[int], engine: str) -> list[int]:
+    """PDF из списка, для которых нет результата конвертации этим движком"""
+    cached = {
+        pdf_id for (pdf_id,) in
+        db.query(ConversionResult.pdf_id)
+        .filter(ConversionResult.pdf_id.in_(pdf_ids), ConversionResult.engine == engine)
+    }
+    return [pdf_id for pdf_id in pdf_ids if pdf_id not in cached]
+
+
+def iter_cells(db: Session, pdf_ids: list[int], engine: str) -> Iterator[tuple]:
+    """Ячейки всех таблиц; результаты читаются из БД по одному, в памяти только текущий документ"""
+    query = (
+        db.query(ConversionResult.pdf_id, ConversionResult.tables_zstd)
+        .filter(ConversionResult.pdf_id.in_(pdf_ids), ConversionResult.engine == engine)
+        .order_by(ConversionResult.pdf_id)
+        .yield_per(1)
+    )
+    for pdf_id, tables_zstd in query:
+        for table in load_tables(tables_zstd):
+            x0, top, x1, bottom = table["bbox"]
+            for row_number, row in enumerate(table["rows"]):
+                for column_number, value in enumerate(row):
+                    yield (pdf_id, table["page"], table["index"], x0, top, x1, bottom,
+                           row_number, column_number, value)
+
+
+def _batches(cells: Iterable[tuple]) -> Iterator[list[tuple]]:
+    batch = []
+    for cell in cells:
+        batch.append(cell)
+        if len(batch) >= BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_csv(cells: Iterable[tuple]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for batch in _batches(cells):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # Без строк данных отдаём хотя бы заголовок
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файл для ParquetWriter, из которого записанные байты забираются и отдаются клиенту"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_parquet(cells: Iterable[tuple]) -> Iterator[bytes]:
+    """Каждая пачка ячеек пишется отдельной row group и сразу уходит клиенту"""
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, SCHEMA, compression="zstd")
+    try:
+        for batch in _batches(cells):
+            columns = list(zip(*batch))
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, SCHEMA)],
+                schema=SCHEMA,
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
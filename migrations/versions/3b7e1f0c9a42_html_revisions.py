@@ -0,0 +1,107 @@
+"""HTML revisions with zstd storage
+
+Revision ID: 3b7e1f0c9a42
+Revises: cf5fd5c09cb0
+Create Date: 2026-10-19 10:12:41.503118
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import zstandard
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e1f0c9a42'
+down_revision: Union[str, None] = 'cf5fd5c09cb0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+html_files = sa.table(
+    'html_files',
+    sa.column('id', sa.Integer),
+    sa.column('content', sa.Text),
+    sa.column('content_zst', sa.LargeBinary),
+    sa.column('upload_date', sa.DateTime),
+    sa.column('file_size', sa.Integer),
+)
+
+html_revisions = sa.table(
+    'html_revisions',
+    sa.column('html_file_id', sa.Integer),
+    sa.column('revision', sa.Integer),
+    sa.column('is_snapshot', sa.Boolean),
+    sa.column('payload', sa.LargeBinary),
+    sa.column('file_size', sa.Integer),
+    sa.column('created_at', sa.DateTime),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('html_revisions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('html_file_id', sa.Integer(), nullable=True),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.Column('is_snapshot', sa.Boolean(), nullable=True),
+    sa.Column('payload', sa.LargeBinary(), nullable=True),
+    sa.Column('file_size', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['html_file_id'], ['html_files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('html_file_id', 'revision')
+    )
+    op.create_index(op.f('ix_html_revisions_id'), 'html_revisions', ['id'], unique=False)
+    op.create_index(op.f('ix_html_revisions_html_file_id'), 'html_revisions', ['html_file_id'], unique=False)
+    op.add_column('html_files', sa.Column('revision', sa.Integer(), nullable=True))
+    op.add_column('html_files', sa.Column('content_zst', sa.LargeBinary(), nullable=True))
+
+    # Сжимаем существующие файлы и делаем их первой ревизией-снимком
+    conn = op.get_bind()
+    compressor = zstandard.ZstdCompressor(level=3)
+    rows = conn.execute(sa.select(html_files.c.id, html_files.c.content, html_files.c.upload_date)).fetchall()
+    for row in rows:
+        raw = (row.content or '').encode('utf-8')
+        compressed = compressor.compress(raw)
+        conn.execute(
+            html_files.update()
+            .where(html_files.c.id == row.id)
+            .values(content_zst=compressed, file_size=len(raw))
+        )
+        conn.execute(html_revisions.insert().values(
+            html_file_id=row.id,
+            revision=1,
+            is_snapshot=True,
+            payload=compressed,
+            file_size=len(raw),
+            created_at=row.upload_date or datetime.now(),
+        ))
+    op.execute("UPDATE html_files SET revision = 1")
+
+    op.drop_column('html_files', 'content')
+    op.alter_column('html_files', 'content_zst', new_column_name='content')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('html_files', sa.Column('content_text', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    decompressor = zstandard.ZstdDecompressor()
+    rows = conn.execute(sa.text("SELECT id, content FROM html_files")).fetchall()
+    for row in rows:
+        text = decompressor.decompress(row.content).decode('utf-8') if row.content else None
+        conn.execute(
+            sa.text("UPDATE html_files SET content_text = :text WHERE id = :id"),
+            {"text": text, "id": row.id},
+        )
+
+    op.drop_column('html_files', 'content')
+    op.alter_column('html_files', 'content_text', new_column_name='content')
+    op.drop_column('html_files', 'revision')
+    op.drop_index(op.f('ix_html_revisions_html_file_id'), table_name='html_revisions')
+    op.drop_index(op.f('ix_html_revisions_id'), table_name='html_revisions')
+    op.drop_table('html_revisions')
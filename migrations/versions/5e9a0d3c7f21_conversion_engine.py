@@ -0,0 +1,39 @@
+"""Table extraction engine in conversion cache key
+
+Revision ID: 5e9a0d3c7f21
+Revises: c41f7b2d9e08
+Create Date: 2026-10-19 14:31:52.088417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e9a0d3c7f21'
+down_revision: Union[str, None] = 'c41f7b2d9e08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Всё, что уже лежит в кэше, сконвертировано camelot lattice
+    op.add_column('conversion_results', sa.Column('engine', sa.String(), nullable=False, server_default='camelot-lattice'))
+    op.alter_column('conversion_results', 'engine', server_default=None)
+    op.drop_index('ix_conversion_results_pdf_id', table_name='conversion_results')
+    op.create_index(op.f('ix_conversion_results_pdf_id'), 'conversion_results', ['pdf_id'], unique=False)
+    op.create_unique_constraint(
+        'conversion_results_pdf_id_engine_key', 'conversion_results', ['pdf_id', 'engine']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('conversion_results_pdf_id_engine_key', 'conversion_results', type_='unique')
+    op.execute("DELETE FROM conversion_results WHERE engine != 'camelot-lattice'")
+    op.drop_index(op.f('ix_conversion_results_pdf_id'), table_name='conversion_results')
+    op.create_index('ix_conversion_results_pdf_id', 'conversion_results', ['pdf_id'], unique=True)
+    op.drop_column('conversion_results', 'engine')
@@ -0,0 +1,154 @@
+"""HTML files stored as page fragments
+
+Revision ID: 8d2c4a6e1b57
+Revises: 3b7e1f0c9a42
+Create Date: 2026-10-19 11:47:03.215960
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import zstandard
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2c4a6e1b57'
+down_revision: Union[str, None] = '3b7e1f0c9a42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+html_pages = sa.table(
+    'html_pages',
+    sa.column('html_file_id', sa.Integer),
+    sa.column('page_number', sa.Integer),
+    sa.column('content', sa.LargeBinary),
+    sa.column('file_size', sa.Integer),
+)
+
+# Копия деления на страницы на момент миграции — не зависит от будущих изменений app/storage
+PAGE_OPEN_RE = re.compile(r'<div\b[^>]*\bclass=["\']page["\'][^>]*>', re.IGNORECASE)
+BODY_CLOSE_RE = re.compile(r'</body', re.IGNORECASE)
+
+
+def split_pages(content: str) -> list[str]:
+    starts = [m.start() for m in PAGE_OPEN_RE.finditer(content)]
+    if not starts:
+        return [content, ""]
+
+    tail_start = len(content)
+    for m in BODY_CLOSE_RE.finditer(content, starts[-1]):
+        tail_start = m.start()
+
+    bounds = [0] + starts + [tail_start, len(content)]
+    return [content[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+def apply_delta(base: str, delta: bytes) -> str:
+    decompressor = zstandard.ZstdDecompressor(
+        dict_data=zstandard.ZstdCompressionDict(base.encode('utf-8'), dict_type=zstandard.DICT_TYPE_RAWCONTENT),
+        max_window_size=1 << 27,
+    )
+    return decompressor.decompress(delta).decode('utf-8')
+
+
+def _snapshot_page_revisions(conn) -> None:
+    """Превращает постраничные дельты в снимки целого документа: до этой миграции
+    дельта всегда относится ко всему документу, и page_number после отката не будет"""
+    compressor = zstandard.ZstdCompressor(level=3)
+    decompressor = zstandard.ZstdDecompressor()
+    file_ids = conn.execute(sa.text(
+        "SELECT DISTINCT html_file_id FROM html_revisions WHERE page_number IS NOT NULL"
+    )).scalars().all()
+    for html_file_id in file_ids:
+        rows = conn.execute(sa.text(
+            "SELECT id, is_snapshot, page_number, payload FROM html_revisions "
+            "WHERE html_file_id = :id ORDER BY revision"
+        ), {"id": html_file_id}).fetchall()
+        content = None
+        for row in rows:
+            if row.is_snapshot:
+                content = decompressor.decompress(row.payload).decode('utf-8')
+            elif content is None:
+                # Цепочка без начального снимка не восстанавливается — оставляем как есть
+                continue
+            elif row.page_number is None:
+                content = apply_delta(content, row.payload)
+            else:
+                fragments = split_pages(content)
+                fragments[row.page_number] = apply_delta(fragments[row.page_number], row.payload)
+                content = "".join(fragments)
+                conn.execute(
+                    sa.text("UPDATE html_revisions SET is_snapshot = true, payload = :payload WHERE id = :id"),
+                    {"payload": compressor.compress(content.encode('utf-8')), "id": row.id},
+                )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('html_pages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('html_file_id', sa.Integer(), nullable=True),
+    sa.Column('page_number', sa.Integer(), nullable=False),
+    sa.Column('content', sa.LargeBinary(), nullable=True),
+    sa.Column('file_size', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['html_file_id'], ['html_files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('html_file_id', 'page_number')
+    )
+    op.create_index(op.f('ix_html_pages_id'), 'html_pages', ['id'], unique=False)
+    op.create_index(op.f('ix_html_pages_html_file_id'), 'html_pages', ['html_file_id'], unique=False)
+    op.add_column('html_files', sa.Column('page_count', sa.Integer(), nullable=True))
+    op.add_column('html_revisions', sa.Column('page_number', sa.Integer(), nullable=True))
+
+    # Делим последнюю версию каждого файла на фрагменты
+    conn = op.get_bind()
+    compressor = zstandard.ZstdCompressor(level=3)
+    decompressor = zstandard.ZstdDecompressor()
+    rows = conn.execute(sa.text("SELECT id, content FROM html_files")).fetchall()
+    for row in rows:
+        content = decompressor.decompress(row.content).decode('utf-8') if row.content else ""
+        fragments = split_pages(content)
+        for page_number, fragment in enumerate(fragments):
+            raw = fragment.encode('utf-8')
+            conn.execute(html_pages.insert().values(
+                html_file_id=row.id,
+                page_number=page_number,
+                content=compressor.compress(raw),
+                file_size=len(raw),
+            ))
+        conn.execute(
+            sa.text("UPDATE html_files SET page_count = :page_count WHERE id = :id"),
+            {"page_count": len(fragments) - 2, "id": row.id},
+        )
+
+    op.drop_column('html_files', 'content')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('html_files', sa.Column('content', sa.LargeBinary(), nullable=True))
+
+    conn = op.get_bind()
+    compressor = zstandard.ZstdCompressor(level=3)
+    decompressor = zstandard.ZstdDecompressor()
+    rows = conn.execute(sa.text(
+        "SELECT html_file_id, content FROM html_pages ORDER BY html_file_id, page_number"
+    )).fetchall()
+    documents = {}
+    for row in rows:
+        documents.setdefault(row.html_file_id, []).append(decompressor.decompress(row.content))
+    for html_file_id, fragments in documents.items():
+        conn.execute(
+            sa.text("UPDATE html_files SET content = :content WHERE id = :id"),
+            {"content": compressor.compress(b"".join(fragments)), "id": html_file_id},
+        )
+
+    _snapshot_page_revisions(conn)
+    op.drop_column('html_revisions', 'page_number')
+    op.drop_column('html_files', 'page_count')
+    op.drop_index(op.f('ix_html_pages_html_file_id'), table_name='html_pages')
+    op.drop_index(op.f('ix_html_pages_id'), table_name='html_pages')
+    op.drop_table('html_pages')
@@ -0,0 +1,31 @@
+"""PDF content hash for thumbnail cache
+
+Revision ID: a7d13e5f4c90
+Revises: 5e9a0d3c7f21
+Create Date: 2026-10-19 15:58:10.640273
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d13e5f4c90'
+down_revision: Union[str, None] = '5e9a0d3c7f21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('pdf_files', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_pdf_files_content_hash'), 'pdf_files', ['content_hash'], unique=False)
+    op.execute("UPDATE pdf_files SET content_hash = encode(sha256(content), 'hex') WHERE content IS NOT NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_pdf_files_content_hash'), table_name='pdf_files')
+    op.drop_column('pdf_files', 'content_hash')
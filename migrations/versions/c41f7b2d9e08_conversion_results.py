@@ -0,0 +1,42 @@
+"""Precompressed conversion results cache
+
+Revision ID: c41f7b2d9e08
+Revises: 8d2c4a6e1b57
+Create Date: 2026-10-19 13:05:26.774410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41f7b2d9e08'
+down_revision: Union[str, None] = '8d2c4a6e1b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('conversion_results',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('pdf_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('html_size', sa.Integer(), nullable=True),
+    sa.Column('html_zstd', sa.LargeBinary(), nullable=True),
+    sa.Column('html_br', sa.LargeBinary(), nullable=True),
+    sa.Column('html_gzip', sa.LargeBinary(), nullable=True),
+    sa.ForeignKeyConstraint(['pdf_id'], ['pdf_files.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_conversion_results_id'), 'conversion_results', ['id'], unique=False)
+    op.create_index(op.f('ix_conversion_results_pdf_id'), 'conversion_results', ['pdf_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_conversion_results_pdf_id'), table_name='conversion_results')
+    op.drop_index(op.f('ix_conversion_results_id'), table_name='conversion_results')
+    op.drop_table('conversion_results')
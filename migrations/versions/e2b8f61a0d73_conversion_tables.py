@@ -0,0 +1,30 @@
+"""Extracted tables in conversion cache for export
+
+Revision ID: e2b8f61a0d73
+Revises: a7d13e5f4c90
+Create Date: 2026-10-19 17:12:44.301958
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b8f61a0d73'
+down_revision: Union[str, None] = 'a7d13e5f4c90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversion_results', sa.Column('tables_zstd', sa.LargeBinary(), nullable=True))
+    # В старых результатах таблиц нет — сбрасываем кэш, он пересоберётся при следующем запросе
+    op.execute("DELETE FROM conversion_results")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conversion_results', 'tables_zstd')